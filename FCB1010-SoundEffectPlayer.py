@@ -1,8 +1,9 @@
 import sys
+import argparse
 import os
-import time
 import random
 import threading
+import queue
 import mido
 import pygame
 from pygame import mixer
@@ -11,18 +12,37 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 # --- 定数 ---
 REFRESH_RATE = 30  # 画面更新頻度(Hz)
 DEFAULT_VOLUME = 1.0 # デフォルトの音量 (最大)
+NUM_SWITCHES = 10 # FCB1010のスイッチ数 (フォルダ1-10に対応)
+EXPRESSION_PEDAL_CC = 7 # エクスプレッションペダルのコントロール番号 (スイッチ7と重なるためペダルを優先)
+NUM_CHANNELS = NUM_SWITCHES # スイッチ1-10に1チャンネルずつ割り当てる
+SOUND_EXTENSIONS = ('.wav', '.mp3', '.ogg') # 再生対象の音声ファイルの拡張子
+AUDIO_FREQUENCY = 44100 # サンプリング周波数(Hz)
+AUDIO_SAMPLE_SIZE = -16 # 符号付き16bit
+AUDIO_OUTPUT_CHANNELS = 2 # ステレオ
+AUDIO_BUFFER_SIZE = 256 # オーディオバッファ(サンプル数)。小さいほど発音までの遅延が短い (256で約5.8ms@44.1kHz)
+AUDIO_FALLBACK_BUFFER_SIZE = 512 # AUDIO_BUFFER_SIZEで初期化できなかった場合のバッファ
+PYGAME_EVENT_TYPES = [pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP] + [pygame.USEREVENT + i for i in range(NUM_CHANNELS)] # 処理するPygameイベント (チャンネル終了イベントを含む)
+MIDI_THREAD_RT_PRIORITY = 10 # MIDIスレッドのリアルタイム優先度 (Linux, SCHED_FIFO)
+PRELOAD_SOUNDS = True # 起動時に音声ファイルを先読みするかどうか (Falseなら初回再生時に読み込む)
+PRELOAD_MIN_FILE_SIZE = 0 # 先読みするファイルの最小サイズ(バイト)。これより小さいファイルは初回再生時に読み込む
 
 # --- グローバル変数 ---
 midi_in = None
 audio_output_device = None
 selected_midi_input_index = -1
 selected_audio_output_index = -1
-current_playing = {}  # {switch_number: (filename, channel, sound)}  # soundオブジェクトも保持
-queued_sounds = {} # {switch_number: filename}  # 再生待ちのサウンド
+current_playing = {}  # {switch_number: (full_path, channel, sound)}  # soundオブジェクトも保持
+queued_sounds = {} # {switch_number: full_path}  # 再生待ちのサウンド
+folder_files = {} # {switch_number: (full_path, ...)}  # 各スイッチのフォルダ内の音声ファイル (起動時/再スキャン時に作成)
+sound_cache = {} # {full_path: Sound}  # デコード済みサウンドのキャッシュ
+preload_thread = None # 実行中の先読みスレッド
+preload_stop = threading.Event() # preload_threadに中断を指示するイベント (先読みごとに作り直す)
+channels = [] # [Channel]  # スイッチごとのチャンネル (init_audioで作成、インデックスはswitch_number - 1)
 volume = DEFAULT_VOLUME
+audio_buffer_size = AUDIO_BUFFER_SIZE # --bufferで上書き可能
 midi_input_level = 0
+midi_messages = queue.SimpleQueue() # 開いているポートのコールバックから受信スレッドへ渡すMIDIメッセージ (Noneで受信スレッドを終了)
 audio_output_level = 0
-lock = threading.Lock()  # スレッド間の排他制御用
 use_midi_volume = True # MIDIコントロールを優先するかどうか
 
 # --- MIDI関連の関数 ---
@@ -35,7 +55,8 @@ def open_midi_input(port_name):
     """MIDI入力を開く"""
     global midi_in
     try:
-        midi_in = mido.open_input(port_name)
+        # 受信はコールバックで行う (ポートを閉じればコールバックも止まり、受信スレッドはポートに依存しない)
+        midi_in = mido.open_input(port_name, callback=midi_messages.put)
         return True
     except Exception as e:
         print(f"Error opening MIDI input: {e}")
@@ -50,59 +71,97 @@ def close_midi_input():
 # --- オーディオ関連の関数 ---
 
 def get_audio_outputs():
-    """利用可能なオーディオ出力デバイスのリストを取得"""
-    pygame.init()  # pygame全体の初期化
-    device_names = []
-
+    """利用可能なオーディオ出力デバイス名のリストを取得"""
     try:
-        num_devices = pygame.mixer.get_num_channels()
-    except pygame.error:
-        print("Error: Pygame mixer could not be initialized. Audio output may not work.")
+        from pygame._sdl2 import audio as sdl2_audio # SDL2版pygame (2.0以降) で利用可能
+        # SDLにデバイス名を問い合わせるだけなので、mixerの初期化し直しは不要
+        return list(sdl2_audio.get_audio_device_names(False)) # False = 出力デバイス
+    except (ImportError, pygame.error) as e:
+        print(f"Error: Could not enumerate audio output devices: {e}")
         return []
 
-    for i in range(num_devices):
-        try:
-            # 各デバイスに対してmixerを初期化を試みる
-            pygame.mixer.init(44100, -16, 2, 512, devicename=str(i))
-            device_names.append(str(i))  # デバイス番号を文字列として追加
-            pygame.mixer.quit()  # 一度閉じる
-        except pygame.error:
-            # 初期化に失敗しても処理を続ける
-            pass
-
-    # main loopでの利用のため、再度初期化
-    pygame.mixer.init()
-
-    return device_names
-
 
-def init_audio(device_index=None):
+def init_audio(device_name=None):
     """オーディオを初期化"""
     global audio_output_device
-    pygame.init()
-
-    if device_index is not None:
+    stop_preload() # 先読み中のデコードとmixerの終了が重ならないようにする
+    sound_cache.clear() # mixerを初期化し直すと既存のSoundは使えないため破棄
+    # mixer.quit()では再生終了イベントが発生しないため、再生中/再生待ちの状態もここで破棄する
+    # (残すとそのスイッチが再生中のままになり、以降の押下がキューに入るだけになる)
+    current_playing.clear()
+    queued_sounds.clear()
+    if mixer.get_init():
+        mixer.quit() # 初期化済みのままではmixer.init()が何もしないため一度閉じる
+
+    # 低遅延のバッファから試し、ホストが対応していなければ大きいバッファで再試行
+    for buffer_size in dict.fromkeys((audio_buffer_size, AUDIO_FALLBACK_BUFFER_SIZE)):
         try:
-           mixer.init(44100,-16, 2, 512, devicename=str(device_index)) # 44100Hz, 16bit, stereo, buffer=512 samples, 指定のデバイス
+            mixer.init(AUDIO_FREQUENCY, AUDIO_SAMPLE_SIZE, AUDIO_OUTPUT_CHANNELS, buffer_size, devicename=device_name) # 指定のデバイス (Noneならデフォルト)
+            break
         except pygame.error as message:
-            print ("Cannot initialize audio device.", message)
-            mixer.init() # デフォルトデバイスで初期化
+            print (f"Cannot initialize audio device (buffer={buffer_size}).", message)
     else:
         mixer.init() # デフォルトデバイスで初期化
 
     audio_output_device = pygame.mixer.get_init()[0]
+    init_channels()
+
+def init_channels():
+    """スイッチごとのチャンネルを作成し、再生終了イベントを設定"""
+    global channels
+    mixer.set_num_channels(NUM_CHANNELS) # デフォルトの8チャンネルではスイッチ9,10が使えないため
+    channels = [mixer.Channel(i) for i in range(NUM_CHANNELS)]
+    for i, channel in enumerate(channels):
+        channel.set_endevent(pygame.USEREVENT + i) # 再生終了時にチャンネルごとのイベントを発生させる
+
+def load_sound(filename):
+    """サウンドをキャッシュから取得 (未読み込みなら読み込んでキャッシュ)"""
+    sound = sound_cache.get(filename)
+    if sound is None:
+        sound = sound_cache.setdefault(filename, mixer.Sound(filename))
+    return sound
+
+def preload_sounds(stop):
+    """folder_filesに登録された音声ファイルを先読みしてキャッシュする (stopがセットされたら中断)"""
+    for files in list(folder_files.values()):
+        for full_path in files:
+            if stop.is_set():
+                return
+            try:
+                if full_path in sound_cache or os.path.getsize(full_path) < PRELOAD_MIN_FILE_SIZE:
+                    continue
+                sound = mixer.Sound(full_path)
+                if stop.is_set():
+                    return # 中断後にデコードしたものは古いmixer用なのでキャッシュしない
+                sound_cache.setdefault(full_path, sound)
+            except Exception as e:
+                print(f"Error preloading sound: {e}")
+
+def start_preload():
+    """音声ファイルの先読みを開始 (UIをブロックしないよう別スレッドで実行)"""
+    global preload_thread, preload_stop
+    stop_preload() # 先読みは同時に1つだけ
+    if PRELOAD_SOUNDS:
+        preload_stop = threading.Event()
+        preload_thread = threading.Thread(target=preload_sounds, args=(preload_stop,), daemon=True)
+        preload_thread.start()
+
+def stop_preload():
+    """実行中の先読みを中断し、終了するまで待つ (デコード中のファイルの読み込みが終わるまで)"""
+    global preload_thread
+    preload_stop.set()
+    if preload_thread is not None:
+        preload_thread.join()
+        preload_thread = None
 
 def play_sound(filename, channel_num):
     """指定されたチャンネルでサウンドを再生"""
     try:
-        sound = mixer.Sound(filename)
-        channel = mixer.Channel(channel_num)
+        sound = load_sound(filename)
+        channel = channels[channel_num] # 再生終了イベントはinit_channelsで設定済み
         channel.play(sound, loops=-1)  # ループ再生
         channel.set_volume(volume)
 
-        # 再生終了コールバックを設定
-        channel.set_endevent() # チャンネルごとに固有のイベントタイプを自動割り当て
-
         return sound, channel
     except Exception as e:
         print(f"Error playing sound: {e}")
@@ -121,28 +180,90 @@ def set_volume(val):
         if channel:
             channel.set_volume(volume)
 
+# --- 音声ファイル一覧 ---
+
+def scan_sound_folders():
+    """フォルダ1-10を走査してfolder_filesを作り直す"""
+    global folder_files
+    scanned = {}
+    for i in range(1, NUM_SWITCHES + 1):
+        folder_path = str(i)
+        if os.path.isdir(folder_path):
+            files = tuple(os.path.join(folder_path, f) for f in os.listdir(folder_path)
+                          if f.endswith(SOUND_EXTENSIONS))
+            if files:
+                scanned[i] = files
+    folder_files = scanned # 丸ごと差し替えて、走査途中の状態を見せない
+
 # --- MIDI/キーボード入力処理 ---
-def process_midi_message():
-    """MIDIメッセージを処理するスレッド"""
-    global midi_input_level, current_playing, audio_output_level, queued_sounds
-    global use_midi_volume, volume
+def raise_thread_priority():
+    """呼び出し元スレッドの優先度を上げる (失敗しても通常の優先度のまま続行)"""
+    try:
+        if sys.platform.startswith('linux'):
+            # pid=0は呼び出し元スレッドを指す (権限が無い場合はPermissionError)
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(MIDI_THREAD_RT_PRIORITY))
+        elif sys.platform == 'win32':
+            import ctypes
+            THREAD_PRIORITY_TIME_CRITICAL = 15
+            kernel32 = ctypes.windll.kernel32
+            if not kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_TIME_CRITICAL):
+                raise ctypes.WinError()
+    except (OSError, AttributeError) as e:
+        print(f"Could not raise MIDI thread priority: {e}")
+
+def process_midi_message(bridge):
+    """MIDIメッセージを受信するスレッド (状態は変更せず、bridgeのシグナルでGUIスレッドに渡すだけ)
+
+    ポートを切り替えても同じスレッドのまま、midi_messagesに届いたメッセージを処理し続ける。
+    midi_messagesにNoneが積まれると終了する。
+    """
+    raise_thread_priority() # GUIスレッドの負荷で入力が遅れないようにする
+
+    while True:
+        msgs = [midi_messages.get()] # メッセージが届くまでブロックして待つ (ビジーループしない)
+        # 溜まっているメッセージもまとめて読み出し、同じコントロールの連続した値は最後の値だけ残す
+        # (エクスプレッションペダル操作で大量に届くCCを1回の処理にまとめる)
+        while True:
+            try:
+                msgs.append(midi_messages.get_nowait())
+            except queue.Empty:
+                break
+
+        batch = []
+        latest = {} # {control: batch内のインデックス}
+        stop = False
+        for msg in msgs:
+            if msg is None: # 終了指示 (Messageとの==比較は例外になるためisで判定する)
+                stop = True
+                break
+            if msg.type != 'control_change':
+                continue
+            index = latest.get(msg.control)
+            # 押下(value>0)/解放(value=0)が切り替わる場合はまとめない (スイッチの押下を取りこぼさないため)
+            if index is not None and (batch[index][1] > 0) == (msg.value > 0):
+                batch[index] = (msg.control, msg.value)
+            else:
+                latest[msg.control] = len(batch)
+                batch.append((msg.control, msg.value))
+
+        for control, value in batch:
+            bridge.control_change.emit(control, value) # 処理はGUIスレッドで行う
+        if stop:
+            return
 
-    if not midi_in:
-      return
-    
-    while True: # 無限ループでMIDIメッセージを監視
-      for msg in midi_in.read(128): # バッファにあるメッセージを全て読み出す
-        if msg.type == 'control_change':
-            midi_input_level = msg.value / 127.0  # MIDIレベルを更新
+def process_control_change(control, value):
+    """MIDIコントロールチェンジを処理 (GUIスレッドから呼ばれる)"""
+    global use_midi_volume, midi_input_level
 
-            if msg.control >= 1 and msg.control <= 10:  # スイッチ1-10
-                switch_number = msg.control
-                process_input(switch_number, msg.value) # MIDIとキーボードで共通の処理
+    midi_input_level = value / 127.0  # MIDIレベルを更新
 
-            elif msg.control == 7:  # エクスプレッションペダル (CC#7)
-                use_midi_volume = True # MIDIボリュームコントロールを有効にする
-                set_volume(msg.value / 127.0)
-      time.sleep(0.001)  # CPU負荷を下げるために少し待機
+    # CC#7はスイッチの範囲(1-10)にも含まれるため、先にペダルとして判定する
+    if control == EXPRESSION_PEDAL_CC:  # エクスプレッションペダル (CC#7)
+        use_midi_volume = True # MIDIボリュームコントロールを有効にする
+        set_volume(value / 127.0)
+
+    elif control >= 1 and control <= NUM_SWITCHES:  # スイッチ1-10 (7を除く)
+        process_input(control, value) # MIDIとキーボードで共通の処理
 
 
 def process_keyboard_input(key_event):
@@ -150,72 +271,65 @@ def process_keyboard_input(key_event):
     if key_event.type == pygame.KEYDOWN:
         if key_event.unicode.isdigit():
             switch_number = int(key_event.unicode)
-            if 1 <= switch_number <= 10:
+            if 1 <= switch_number <= NUM_SWITCHES:
                 process_input(switch_number, 127) # キー押下をvalue=127として扱う
     elif key_event.type == pygame.KEYUP:
          if key_event.unicode.isdigit():
             switch_number = int(key_event.unicode)
-            if 1 <= switch_number <= 10:
+            if 1 <= switch_number <= NUM_SWITCHES:
                 process_input(switch_number, 0) # キー押下をvalue=0として扱う
 
 def process_input(switch_number, value):
     """MIDI/キーボード入力共通の処理"""
-    folder_path = str(switch_number)
-
-    if os.path.isdir(folder_path):
-        files = [f for f in os.listdir(folder_path) if f.endswith(('.wav', '.mp3', '.ogg'))]
-        if not files:
-            return
-
-        with lock:  # 排他制御を開始
-            if value > 0:  # スイッチ/キーが押された
-                filename = random.choice(files)
-                if switch_number in current_playing:
-                    # 既に再生中の場合はキューに追加
-                    queued_sounds[switch_number] = filename
-                else:
-                    # 再生中でなければ即座に再生
-                    full_path = os.path.join(folder_path, filename)
-                    sound, channel = play_sound(full_path, switch_number - 1)
-                    if sound and channel:
-                        current_playing[switch_number] = (filename, channel, sound) #soundも保持
-            else:  # スイッチ/キーが離された
-                if switch_number in current_playing:
-                    _, channel, _ = current_playing[switch_number] # soundオブジェクトは使用しない
-                    if channel:
-                         channel.fadeout(500)
-                    # キューには追加/削除しない（再生終了時に処理）
+    files = folder_files.get(switch_number) # 事前に作成した一覧を参照 (ここではファイルシステムにアクセスしない)
+    if not files:
+        return
+
+    if value > 0:  # スイッチ/キーが押された
+        full_path = random.choice(files)
+        if switch_number in current_playing:
+            # 既に再生中の場合はキューに追加
+            queued_sounds[switch_number] = full_path
+        else:
+            # 再生中でなければ即座に再生
+            sound, channel = play_sound(full_path, switch_number - 1)
+            if sound and channel:
+                current_playing[switch_number] = (full_path, channel, sound) #soundも保持
+    else:  # スイッチ/キーが離された
+        if switch_number in current_playing:
+            _, channel, _ = current_playing[switch_number] # soundオブジェクトは使用しない
+            if channel:
+                 channel.fadeout(500)
+            # キューには追加/削除しない（再生終了時に処理）
 
 # --- Pygameイベント処理 ---
+def init_event_filter():
+    """処理しないイベント(マウス、ウィンドウ等)がキューに溜まらないようにする"""
+    pygame.event.set_blocked(None) # 全てのイベントを一旦ブロック
+    pygame.event.set_allowed(PYGAME_EVENT_TYPES)
+
 def process_pygame_events():
     """Pygameのイベント(音声再生終了、キーボード入力)を処理する"""
     global current_playing, queued_sounds
 
-    for event in pygame.event.get():
+    for event in pygame.event.get(PYGAME_EVENT_TYPES): # 処理対象のイベントだけを取り出す
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
 
-        if event.type == pygame.USEREVENT: # チャンネル終了イベント
-             with lock:
-                # 終了したチャンネルを探す
-                finished_channel_number = None
-                for switch_num, (_, channel, _) in current_playing.items():
-                    if not channel.get_busy(): # 再生終了を検知
-                        finished_channel_number = switch_num
-                        break
+        if pygame.USEREVENT <= event.type < pygame.USEREVENT + NUM_CHANNELS: # チャンネル終了イベント
+            # イベントの種類から終了したチャンネル(スイッチ番号)が分かる
+            finished_channel_number = event.type - pygame.USEREVENT + 1
 
-                if finished_channel_number is not None:
-                    del current_playing[finished_channel_number]  # 再生終了したエントリを削除
+            if finished_channel_number in current_playing:
+                del current_playing[finished_channel_number]  # 再生終了したエントリを削除
 
-                    # キューに次のサウンドがあれば再生
-                    if finished_channel_number in queued_sounds:
-                        filename = queued_sounds.pop(finished_channel_number)
-                        folder_path = str(finished_channel_number)
-                        full_path = os.path.join(folder_path, filename)
-                        sound, channel = play_sound(full_path, finished_channel_number - 1)
-                        if sound and channel:
-                            current_playing[finished_channel_number] = (filename, channel, sound)
+                # キューに次のサウンドがあれば再生
+                if finished_channel_number in queued_sounds:
+                    full_path = queued_sounds.pop(finished_channel_number)
+                    sound, channel = play_sound(full_path, finished_channel_number - 1)
+                    if sound and channel:
+                        current_playing[finished_channel_number] = (full_path, channel, sound)
 
 
         # キーボード入力イベントの処理
@@ -224,7 +338,24 @@ def process_pygame_events():
 
 # --- GUI関連のクラス ---
 
+class MidiBridge(QtCore.QObject):
+    """MIDIスレッドからGUIスレッドへイベントを渡すためのオブジェクト"""
+    control_change = QtCore.pyqtSignal(int, int) # (control, value)
+
+class DeviceEnumerator(QtCore.QThread):
+    """オーディオ出力デバイスをバックグラウンドで列挙するスレッド"""
+    done = QtCore.pyqtSignal(list) # 列挙したデバイス名のリスト
+
+    def run(self):
+        self.done.emit(get_audio_outputs())
+
 class MainWindow(QtWidgets.QMainWindow):
+    # ファイルリストの配色 (毎フレーム生成しないようにクラスで保持)
+    _COL_GREEN = QtGui.QColor(0, 255, 0) # 再生中の背景
+    _COL_INV_GREEN = QtGui.QColor(_COL_GREEN.rgb() ^ 0xFFFFFF) # 再生中の文字 (背景の反転色)
+    _COL_WHITE = QtGui.QColor(255, 255, 255) # 通常の背景
+    _COL_BLACK = QtGui.QColor(0, 0, 0) # 通常の文字
+
     def __init__(self):
         super().__init__()
 
@@ -233,12 +364,28 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setCentralWidget(self.central_widget)
 
         self.layout = QtWidgets.QVBoxLayout(self.central_widget)
+        self._items_by_path = {} # {full_path: QListWidgetItem}  # 再生中の項目だけを直接更新するための索引
+        self._prev_playing_paths = set() # 前回ファイルリストに反映した再生中のファイル
+
+        # --- デバイス一覧 (列挙は重いので起動時と「Refresh devices」押下時のみ行う) ---
+        self._midi_inputs = get_midi_inputs()
+        self._audio_outputs = [] # DeviceEnumeratorの列挙が終わると設定される
+        self.device_enumerator = None
+
+        # --- MIDIスレッドとの橋渡し (状態の変更は全てGUIスレッドで行う) ---
+        self.midi_bridge = MidiBridge()
+        # キュー接続なので、MIDIスレッドからemitされてもスロットはGUIスレッドで呼ばれる
+        self.midi_bridge.control_change.connect(self.midi_control_changed, QtCore.Qt.QueuedConnection)
+
+        # --- MIDIメッセージ処理スレッド開始 (ポートを切り替えても同じスレッドを使い続ける) ---
+        self.midi_thread = threading.Thread(target=process_midi_message, args=(self.midi_bridge,), daemon=True)
+        self.midi_thread.start()
 
         # --- MIDI入力デバイス選択 ---
         self.midi_input_label = QtWidgets.QLabel("MIDI Input Device:")
         self.layout.addWidget(self.midi_input_label)
         self.midi_input_combo = QtWidgets.QComboBox()
-        self.midi_input_combo.addItems(get_midi_inputs())
+        self.midi_input_combo.addItems(self._midi_inputs)
         self.midi_input_combo.currentIndexChanged.connect(self.select_midi_input)
         self.layout.addWidget(self.midi_input_combo)
 
@@ -246,9 +393,13 @@ class MainWindow(QtWidgets.QMainWindow):
         self.audio_output_label = QtWidgets.QLabel("Audio Output Device:")
         self.layout.addWidget(self.audio_output_label)
         self.audio_output_combo = QtWidgets.QComboBox()
-        self.audio_output_combo.addItems(get_audio_outputs())
+        self.audio_output_combo.addItem("<scanning...>") # 列挙が終わるまでの仮表示
+        self.audio_output_combo.setEnabled(False)
         self.audio_output_combo.currentIndexChanged.connect(self.select_audio_output)
         self.layout.addWidget(self.audio_output_combo)
+        self.refresh_devices_button = QtWidgets.QPushButton("Refresh devices")
+        self.refresh_devices_button.clicked.connect(self.refresh_devices)
+        self.layout.addWidget(self.refresh_devices_button)
 
 
         # --- ボリュームコントロール ---
@@ -267,6 +418,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.file_list_widget = QtWidgets.QListWidget()
         self.layout.addWidget(self.file_list_widget)
         self.file_list_widget.setMinimumHeight(200) # ファイルリストの最低限の高さ
+        self.rescan_button = QtWidgets.QPushButton("Rescan")
+        self.rescan_button.clicked.connect(self.rescan_files)
+        self.layout.addWidget(self.rescan_button)
 
         # --- MIDI入力レベル表示 ---
         self.midi_level_label = QtWidgets.QLabel("MIDI Input Level:")
@@ -289,12 +443,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # --- 初期化 ---
         self.select_midi_input(self.midi_input_combo.currentIndex())
-        self.select_audio_output(self.audio_output_combo.currentIndex())
+        scan_sound_folders() # 先読みはオーディオ出力の初期化後に行う
         self.update_file_list()
+        self.scan_audio_outputs() # 列挙が終わるとオーディオ出力を初期化する
 
-        # --- MIDIメッセージ処理スレッド開始 ---
-        self.midi_thread = threading.Thread(target=process_midi_message, daemon=True)
-        self.midi_thread.start()
+    @QtCore.pyqtSlot(int, int)
+    def midi_control_changed(self, control, value):
+        """MIDIスレッドからコントロールチェンジが届いたときの処理"""
+        process_control_change(control, value)
 
     def slider_volume_changed(self, value):
         """スライダーの値が変更されたときの処理"""
@@ -307,9 +463,9 @@ class MainWindow(QtWidgets.QMainWindow):
         global selected_midi_input_index, use_midi_volume
         if selected_midi_input_index != index:
           close_midi_input()
-          if open_midi_input(get_midi_inputs()[index]):
+          if open_midi_input(self._midi_inputs[index]):
              selected_midi_input_index = index
-             print(f"Selected MIDI input: {get_midi_inputs()[index]}")
+             print(f"Selected MIDI input: {self._midi_inputs[index]}")
              use_midi_volume = True # MIDI入力を開いたらMIDIボリュームを有効化
           else:
               QtWidgets.QMessageBox.warning(self, "Error", "Failed to open selected MIDI input.")
@@ -321,34 +477,99 @@ class MainWindow(QtWidgets.QMainWindow):
         global selected_audio_output_index, audio_output_device
         selected_audio_output_index = index
 
-        # 利用可能なオーディオ出力デバイスのリストを取得 (get_audio_outputs()を再呼び出し)
-        available_devices = get_audio_outputs()
+        # 利用可能なオーディオ出力デバイスのリスト (キャッシュ済みの一覧を使う)
+        available_devices = self._audio_outputs
         if not available_devices:  # デバイスが1つも見つからない場合
             QtWidgets.QMessageBox.warning(self, "Error", "No audio output devices found.")
+            init_audio()  # デフォルトデバイスで初期化を試みる
+            start_preload()
             return
 
         if index < len(available_devices):  # 選択されたインデックスが有効範囲内なら
             try:
                 #選択されたデバイスで初期化
-                init_audio(int(available_devices[index]))  # 文字列を整数に変換
-                print(f"Selected audio output: Device {available_devices[index]}") # 選択されたデバイス番号を表示
+                init_audio(available_devices[index])  # デバイス名をそのままmixerに渡す
+                print(f"Selected audio output: {available_devices[index]}") # 選択されたデバイス名を表示
+                start_preload() # mixerの初期化でキャッシュが破棄されたため読み込み直す
             except pygame.error as message:
                 QtWidgets.QMessageBox.warning(self, "Error", f"Cannot initialize audio device: {message}")
         else:  # indexが範囲外の場合(通常は起こらないはず)
             QtWidgets.QMessageBox.warning(self, "Error", "Invalid audio output device selected.")
             init_audio()  # デフォルトデバイスで初期化を試みる
-
+            start_preload()
+
+
+    def refresh_devices(self):
+        """MIDI/オーディオデバイスを列挙し直してコンボボックスを更新"""
+        global selected_midi_input_index
+        current_midi = self.midi_input_combo.currentText()
+
+        self._midi_inputs = get_midi_inputs()
+
+        # 一覧の入れ替え中に選択処理が走らないようにシグナルを止める
+        self.midi_input_combo.blockSignals(True)
+        self.midi_input_combo.clear()
+        self.midi_input_combo.addItems(self._midi_inputs)
+        if current_midi in self._midi_inputs:
+            self.midi_input_combo.setCurrentIndex(self._midi_inputs.index(current_midi))
+            selected_midi_input_index = self.midi_input_combo.currentIndex() # 同じポートは開き直さない
+        else:
+            selected_midi_input_index = -1 # 選択中のポートが無くなった場合は開き直す
+        self.midi_input_combo.blockSignals(False)
+
+        if self._midi_inputs:
+            self.select_midi_input(self.midi_input_combo.currentIndex())
+
+        self.scan_audio_outputs()
+
+    def scan_audio_outputs(self):
+        """オーディオ出力デバイスの列挙をバックグラウンドで開始 (結果はaudio_outputs_scannedで受け取る)"""
+        if self.device_enumerator is not None and self.device_enumerator.isRunning():
+            return # 列挙中なら結果を待つ
+        # 列挙中にデバイスを選択されると、mixerの再初期化とSDLのデバイス列挙が同時に走るため選択も止める
+        self.audio_output_combo.setEnabled(False)
+        self.refresh_devices_button.setEnabled(False)
+        self.device_enumerator = DeviceEnumerator(self)
+        self.device_enumerator.done.connect(self.audio_outputs_scanned)
+        self.device_enumerator.start()
+
+    def audio_outputs_scanned(self, devices):
+        """オーディオ出力デバイスの列挙が終わったときの処理 (GUIスレッドで呼ばれる)"""
+        current_audio = self.audio_output_combo.currentText() if self._audio_outputs else None
+        self._audio_outputs = devices
+
+        # 一覧の入れ替え中に選択処理が走らないようにシグナルを止める
+        self.audio_output_combo.blockSignals(True)
+        self.audio_output_combo.clear()
+        self.audio_output_combo.addItems(self._audio_outputs)
+        audio_changed = current_audio not in self._audio_outputs
+        if not audio_changed:
+            self.audio_output_combo.setCurrentIndex(self._audio_outputs.index(current_audio))
+        self.audio_output_combo.setEnabled(True)
+        self.audio_output_combo.blockSignals(False)
+
+        if audio_changed: # 同じデバイスならmixerは初期化し直さない (再生中の音が途切れないように)
+            self.select_audio_output(self.audio_output_combo.currentIndex())
+        self.refresh_devices_button.setEnabled(True)
+
+    def rescan_files(self):
+        """フォルダを再スキャンしてファイルリストを更新"""
+        scan_sound_folders()
+        self.update_file_list()
+        start_preload()
 
     def update_file_list(self):
         """ファイルリストを更新"""
         self.file_list_widget.clear()
-        for i in range(1, 11):
-            folder_path = str(i)
-            if os.path.isdir(folder_path):
-                files = [f for f in os.listdir(folder_path) if f.endswith(('.wav', '.mp3', '.ogg'))]
-                for filename in files:
-                    item = QtWidgets.QListWidgetItem(f"{i}: {filename}")
-                    self.file_list_widget.addItem(item)
+        self._items_by_path = {}
+        self._prev_playing_paths = set() # 項目は全て非再生の色で作り直す
+        for i, files in sorted(folder_files.items()):
+            for full_path in files:
+                item = QtWidgets.QListWidgetItem(f"{i}: {os.path.basename(full_path)}")
+                item.setBackground(self._COL_WHITE)  # 白色の背景
+                item.setForeground(self._COL_BLACK) # 黒色の文字
+                self.file_list_widget.addItem(item)
+                self._items_by_path[full_path] = item
 
     def update_gui(self):
         """GUIを更新"""
@@ -358,30 +579,27 @@ class MainWindow(QtWidgets.QMainWindow):
         process_pygame_events()
 
         # ファイルの再生状況を更新(文字色を反転)
-        with lock:
-            for i in range(self.file_list_widget.count()):
-                item = self.file_list_widget.item(i)
-                folder_num = int(item.text().split(':')[0])
-                if folder_num in current_playing:
-                    if current_playing[folder_num][0] == item.text().split(': ')[1]:
-                        item.setBackground(QtGui.QColor(0, 255, 0))  # 緑色の背景
-                        # 反転色を取得
-                        inverted_color = item.background().color().rgb() ^ 0xFFFFFF
-                        item.setForeground(QtGui.QColor(inverted_color))
-
-                    else:
-                        item.setBackground(QtGui.QColor(255, 255, 255))  # 白色の背景
-                        item.setForeground(QtGui.QColor(0, 0, 0)) # 黒色の文字
-                else:
-                    item.setBackground(QtGui.QColor(255, 255, 255))  # 白色の背景
-                    item.setForeground(QtGui.QColor(0, 0, 0)) # 黒色の文字
+        # 全項目は走査せず、再生状態が変わった項目 (最大でチャンネル数) だけを更新する
+        playing_paths = {full_path for full_path, _, _ in current_playing.values()}
+        if playing_paths != self._prev_playing_paths: # 再生状況が前回から変わっていなければ何もしない
+            for full_path in self._prev_playing_paths - playing_paths: # 再生が終わった項目
+                item = self._items_by_path.get(full_path)
+                if item:
+                    item.setBackground(self._COL_WHITE)  # 白色の背景
+                    item.setForeground(self._COL_BLACK) # 黒色の文字
+            for full_path in playing_paths - self._prev_playing_paths: # 再生が始まった項目
+                item = self._items_by_path.get(full_path)
+                if item:
+                    item.setBackground(self._COL_GREEN)  # 緑色の背景
+                    item.setForeground(self._COL_INV_GREEN) # 反転色の文字
+            self._prev_playing_paths = playing_paths
 
         # MIDI入力レベルを更新
         self.midi_level_bar.setValue(int(midi_input_level * 100))
 
         # オーディオ出力レベルを更新 (アクティブなチャンネル数で代用)
         num_busy_channels = pygame.mixer.get_busy()
-        self.audio_level_bar.setValue(int((num_busy_channels / 10) * 100)) # 10個のチャンネルを前提に正規化
+        self.audio_level_bar.setValue(int((num_busy_channels / NUM_CHANNELS) * 100)) # NUM_CHANNELS個のチャンネルを前提に正規化
 
         # ボリュームスライダーの位置を更新 (MIDIコントロールが有効な場合は更新しない)
         if not use_midi_volume:
@@ -393,13 +611,30 @@ class MainWindow(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         """ウィンドウが閉じられたときの処理"""
         close_midi_input()
+        midi_messages.put(None) # MIDI受信スレッドを終了させる
+        if self.device_enumerator is not None:
+            self.device_enumerator.wait() # 実行中のQThreadを破棄しないように終了を待つ
+        stop_preload() # デコード中にpygameを終了しないようにする
         pygame.quit()
         event.accept()
 
 # --- メイン処理 ---
 
 if __name__ == "__main__":
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="FCB1010 Sound Player")
+    parser.add_argument("--buffer", type=int, default=AUDIO_BUFFER_SIZE,
+                        help=f"audio buffer size in samples (default: {AUDIO_BUFFER_SIZE})")
+    args, qt_args = parser.parse_known_args() # 残りの引数はQtに渡す
+    audio_buffer_size = args.buffer
+
+    # pygameの初期化は起動時の1回だけ (mixerはpre_initの設定で初期化される)
+    pygame.mixer.pre_init(AUDIO_FREQUENCY, AUDIO_SAMPLE_SIZE, AUDIO_OUTPUT_CHANNELS, audio_buffer_size)
+    pygame.init()
+    init_event_filter()
+    if mixer.get_init():
+        init_channels() # デバイス列挙が終わるまではデフォルトデバイスで再生できるようにする
+
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     window = MainWindow()
     window.show()
     sys.exit(app.exec_())